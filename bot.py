@@ -4,13 +4,20 @@
 Telegram бот для конвертации Excel файлов с пуш-уведомлениями в JSON формат.
 """
 
+import asyncio
+import copy
+import hashlib
 import os
-import json
 import logging
-import tempfile
-from typing import Dict, Any, List
+import re
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, Any, List, Optional, Union
+import numpy as np
+import orjson
 import pandas as pd
-from telegram import Update, Document
+from telegram import Update, Document, InputMediaDocument
+from telegram.constants import ParseMode
 from telegram.ext import (
     Application, 
     CommandHandler, 
@@ -26,116 +33,169 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Скомпилированный один раз паттерн со всеми специальными символами MarkdownV2
+_MARKDOWN_SPECIAL_RE = re.compile(r'([_*\[\]()~`>#+\-=|{}.!])')
+
 def escape_markdown(text: str) -> str:
-    """Экранирует специальные символы для Markdown."""
-    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in special_chars:
-        text = text.replace(char, f'\\{char}')
-    return text
+    """Экранирует специальные символы для MarkdownV2."""
+    # Один проход re.sub вместо 18 вызовов str.replace
+    return _MARKDOWN_SPECIAL_RE.sub(r'\\\1', text)
 
 class PushExcelConverter:
     """Класс для конвертации Excel файлов с пуш-уведомлениями в JSON."""
-    
+
+    # Максимальное количество записей в кэше разобранных файлов
+    PARSE_CACHE_SIZE = 32
+
+    def __init__(self):
+        """Инициализация конвертера."""
+        # LRU-кэш результатов парсинга по хэшу содержимого файла
+        self._parse_cache: OrderedDict = OrderedDict()
+
     @staticmethod
-    def parse_excel_to_categories(file_path: str) -> Dict[str, Dict[str, Any]]:
+    def content_hash(content: bytes) -> str:
+        """Считает хэш содержимого файла для ключа кэша."""
+        return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+    def get_cached_categories(self, content_hash: str) -> Optional[Dict[str, Dict[str, Any]]]:
         """
-        Конвертирует Excel файл в JSON формат с отдельными файлами для каждой категории.
-        
+        Возвращает закэшированный результат парсинга или None.
+
         Args:
-            file_path: Путь к Excel файлу
-            
+            content_hash: Хэш содержимого Excel файла
+
+        Returns:
+            Глубокая копия данных категорий, если файл уже разбирался
+        """
+        cached = self._parse_cache.get(content_hash)
+        if cached is None:
+            return None
+
+        self._parse_cache.move_to_end(content_hash)
+        # Копия защищает кэш от мутаций со стороны вызывающего кода
+        return copy.deepcopy(cached)
+
+    def cache_categories(self, content_hash: str, categories_data: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Сохраняет результат парсинга в кэш, вытесняя самую старую запись.
+
+        Args:
+            content_hash: Хэш содержимого Excel файла
+            categories_data: Данные категорий
+        """
+        self._parse_cache[content_hash] = categories_data
+        self._parse_cache.move_to_end(content_hash)
+
+        if len(self._parse_cache) > self.PARSE_CACHE_SIZE:
+            self._parse_cache.popitem(last=False)
+
+    @staticmethod
+    def read_excel(source: Union[str, BytesIO]) -> pd.DataFrame:
+        """
+        Читает Excel файл в DataFrame.
+
+        Args:
+            source: Путь к Excel файлу или файловый объект с его содержимым
+
+        Returns:
+            DataFrame с данными файла
+        """
+        # calamine (Rust) парсит xlsx в разы быстрее openpyxl
+        return pd.read_excel(source, engine="calamine")
+
+    @staticmethod
+    def parse_excel_to_categories(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+        """
+        Конвертирует данные Excel файла в JSON формат с отдельными файлами для каждой категории.
+
+        Args:
+            df: DataFrame с данными Excel файла
+
         Returns:
             Dict с категориями и их данными
         """
         try:
-            # Читаем Excel файл
-            df = pd.read_excel(file_path)
-            
             # Получаем список языков (уникальные значения в первой колонке, исключая NaN)
             languages = df.iloc[:, 0].dropna().unique().tolist()
             
             # Получаем названия категорий (колонки кроме первой)
             categories = df.columns[1:].tolist()
             
+            # Кодируем первую колонку как Categorical: дальше работаем
+            # с int8-кодами вместо сравнения строк (NaN получает код -1)
+            lang_codes = pd.Categorical(df.iloc[:, 0], categories=languages).codes
+
+            # Один проход по первой колонке вместо iterrows:
+            # булева маска "строка содержит язык" и номер группы через cumsum
+            is_lang = lang_codes >= 0
+            is_first = lang_codes == 0
+            group_id = np.cumsum(is_first) - 1
+
+            # Группируем строки по пушам: каждая группа начинается с первого языка
+            starts = np.flatnonzero(is_first)
+            all_rows = np.arange(len(df))
+            push_groups = [
+                group for group in np.split(all_rows, starts)
+                if len(group) and group_id[group[0]] >= 0
+            ]
+
+            # Все колонки категорий одним 2D-массивом вместо df.loc по ячейкам;
+            # NaN и приведение к строкам обрабатываются одной векторной операцией.
+            # F-order хранит каждую колонку непрерывно - обход по категориям
+            # идет по последовательной памяти
+            cat_matrix = np.asfortranarray(df.iloc[:, 1:].fillna("").astype(str).to_numpy())
+
             # Результат - словарь с данными для каждой категории
-            categories_data = {}
-            
-            # Создаем данные для каждой категории отдельно
-            for category in categories:
-                # Структура для текущей категории
-                category_result = {
+            categories_data = {
+                category: {
                     "languages": languages,
                     "pushes": []
                 }
-                
-                # Группируем строки по пушам
-                push_groups = []
-                current_group = []
-                
-                # Проходим по всем строкам и группируем по языкам
-                for i, row in df.iterrows():
-                    lang = row.iloc[0]
-                    
-                    if pd.notna(lang):  # Начало нового языка
-                        if lang == languages[0] and current_group:  # Если это первый язык и уже есть группа
-                            push_groups.append(current_group)
-                            current_group = []
-                        current_group.append(i)
-                    else:  # Строка с сообщением (NaN в первой колонке)
-                        if current_group:
-                            current_group.append(i)
-                
-                # Добавляем последнюю группу
-                if current_group:
-                    push_groups.append(current_group)
-                
-                # Создаем пуши из групп
-                push_id = 1
-                for group in push_groups:
-                    # Проверяем, что в группе есть все языки
+                for category in categories
+            }
+
+            # Строка сообщения для строки заголовка - следующая строка без языка;
+            # группы непрерывны, поэтому пары считаются векторно для всего листа
+            has_message = np.zeros(len(df), dtype=bool)
+            has_message[:-1] = ~is_lang[1:]
+            message_rows = np.where(has_message, all_rows + 1, -1)
+
+            # Один проход по группам: пары (язык, заголовок, сообщение)
+            # собираются единожды и переиспользуются для всех категорий
+            for group in push_groups:
+                # Собираем (язык, строка заголовка, строка сообщения)
+                title_rows = group[is_lang[group]]
+                entries = [
+                    (languages[lang_codes[row_idx]], row_idx, message_rows[row_idx])
+                    for row_idx in title_rows
+                ]
+
+                # Заполняем переводы по всем категориям из одних и тех же строк
+                for col_idx, category in enumerate(categories):
                     push_translations = {}
-                    
-                    i = 0
-                    while i < len(group):
-                        row_idx = group[i]
-                        lang = df.iloc[row_idx, 0]
-                        
-                        if pd.notna(lang) and lang in languages:
-                            title = df.loc[row_idx, category] if category in df.columns else ""
-                            message = ""
-                            
-                            # Проверяем следующую строку для сообщения
-                            if i + 1 < len(group):
-                                next_row_idx = group[i + 1]
-                                if pd.isna(df.iloc[next_row_idx, 0]):
-                                    message = df.iloc[next_row_idx][category] if category in df.columns else ""
-                                    i += 1  # Пропускаем строку с сообщением
-                            
-                            push_translations[lang] = {
-                                "title": str(title) if pd.notna(title) else "",
-                                "message": str(message) if pd.notna(message) else ""
-                            }
-                        
-                        i += 1
-                    
+                    for lang, title_row, message_row in entries:
+                        # Ячейки уже строки - ни pd.notna, ни str() не нужны
+                        push_translations[lang] = {
+                            "title": cat_matrix[title_row, col_idx],
+                            "message": cat_matrix[message_row, col_idx] if message_row >= 0 else ""
+                        }
+
                     # Фильтруем пустые переводы
                     filtered_translations = {}
                     for lang, translation in push_translations.items():
                         if translation["title"].strip() or translation["message"].strip():
                             filtered_translations[lang] = translation
-                    
+
                     # Добавляем пуш только если есть хотя бы один непустой перевод
                     if filtered_translations:
+                        pushes = categories_data[category]["pushes"]
+                        push_id = len(pushes) + 1
                         push_data = {
-                            "id": f"push_{str(push_id).zfill(3)}",
+                            "id": f"push_{push_id:03d}",
                             "translations": filtered_translations
                         }
-                        category_result["pushes"].append(push_data)
-                        push_id += 1
-                
-                # Сохраняем данные категории
-                categories_data[category] = category_result
-            
+                        pushes.append(push_data)
+
             return categories_data
             
         except Exception as e:
@@ -143,19 +203,17 @@ class PushExcelConverter:
             raise
     
     @staticmethod
-    def validate_excel_structure(file_path: str) -> bool:
+    def validate_excel_structure(df: pd.DataFrame) -> bool:
         """
-        Проверяет структуру Excel файла.
-        
+        Проверяет структуру данных Excel файла.
+
         Args:
-            file_path: Путь к Excel файлу
-            
+            df: DataFrame с данными Excel файла
+
         Returns:
             True если структура корректна, иначе False
         """
         try:
-            df = pd.read_excel(file_path)
-            
             # Проверяем, что файл не пустой
             if df.empty:
                 return False
@@ -165,8 +223,7 @@ class PushExcelConverter:
                 return False
             
             # Проверяем, что в первой колонке есть языки
-            languages = df.iloc[:, 0].dropna().unique()
-            if len(languages) == 0:
+            if not df.iloc[:, 0].notna().any():
                 return False
             
             return True
@@ -187,8 +244,8 @@ class TelegramBot:
         # Добавляем обработчики
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(MessageHandler(filters.Document.FileExtension("xlsx"), self.handle_excel_file))
-        self.application.add_handler(MessageHandler(filters.Document.FileExtension("xls"), self.handle_excel_file))
+        excel_filter = filters.Document.FileExtension("xlsx") | filters.Document.FileExtension("xls")
+        self.application.add_handler(MessageHandler(excel_filter, self.handle_excel_file))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text))
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -272,15 +329,27 @@ class TelegramBot:
                 parse_mode='Markdown'
             )
             
-            # Создаем временный файл
-            with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as temp_file:
-                # Скачиваем файл
-                file = await document.get_file()
-                await file.download_to_drive(temp_file.name)
-                
-                try:
+            # Скачиваем файл сразу в память, без временного файла на диске
+            excel_buffer = BytesIO()
+            file = await document.get_file()
+            await file.download_to_memory(excel_buffer)
+            excel_buffer.seek(0)
+
+            try:
+                # Блокирующую работу pandas выполняем в пуле потоков,
+                # чтобы не останавливать event loop для остальных пользователей
+                loop = asyncio.get_running_loop()
+
+                # Повторная загрузка того же файла обслуживается из кэша
+                content_hash = self.converter.content_hash(excel_buffer.getvalue())
+                categories_data = self.converter.get_cached_categories(content_hash)
+
+                if categories_data is None:
+                    # Читаем Excel файл один раз и передаем DataFrame дальше
+                    df = await loop.run_in_executor(None, self.converter.read_excel, excel_buffer)
+
                     # Валидируем структуру файла
-                    if not self.converter.validate_excel_structure(temp_file.name):
+                    if not self.converter.validate_excel_structure(df):
                         await processing_msg.edit_text(
                             "**❌ Ошибка в структуре файла**\n\n"
                             "*Файл не соответствует ожидаемой структуре!*\n\n"
@@ -292,86 +361,113 @@ class TelegramBot:
                             parse_mode='Markdown'
                         )
                         return
-                    
+
                     # Конвертируем в JSON (получаем данные для каждой категории)
-                    categories_data = self.converter.parse_excel_to_categories(temp_file.name)
-                    
-                    # Создаем отдельные JSON файлы для каждой категории
-                    json_files_paths = []
-                    json_filenames = []
-                    
-                    base_filename = document.file_name.split('.')[0]
-                    
-                    for category, category_data in categories_data.items():
-                        # Создаем имя файла для категории
-                        safe_category = category.lower().replace(' ', '_').replace('&', 'and')
-                        json_filename = f"{safe_category}_{base_filename}.json"
-                        
-                        # Создаем временный JSON файл
-                        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as json_file:
-                            json.dump(category_data, json_file, ensure_ascii=False, indent=2)
-                            json_files_paths.append(json_file.name)
-                            json_filenames.append(json_filename)
-                    
-                    # Отправляем информационное сообщение
-                    total_languages = len(list(categories_data.values())[0]['languages'])
-                    total_categories = len(categories_data)
-                    
-                    # Экранируем специальные символы для Markdown
-                    safe_filename = escape_markdown(document.file_name)
-                    
-                    info_message = (
-                        "**✅ Конвертация завершена!**\n\n"
-                        f"**📁 Исходный файл:** {safe_filename}\n"
-                        f"**📊 Найдено языков:** {total_languages}\n"
-                        f"**📋 Найдено категорий:** {total_categories}\n\n"
-                        f"**🌍 Языки:** {', '.join(list(categories_data.values())[0]['languages'])}\n\n"
-                        f"**📦 Создано файлов:** {len(json_files_paths)}\n"
-                        "*Отправляю отдельные JSON файлы для каждой категории\\.\\.\\. 🚀*"
+                    categories_data = await loop.run_in_executor(
+                        None, self.converter.parse_excel_to_categories, df
                     )
-                    
-                    await processing_msg.edit_text(info_message, parse_mode='Markdown')
-                    
-                    # Отправляем каждый JSON файл отдельно
-                    for i, (json_file_path, json_filename) in enumerate(zip(json_files_paths, json_filenames)):
-                        category_name = list(categories_data.keys())[i]
-                        category_data = list(categories_data.values())[i]
-                        
-                        with open(json_file_path, 'rb') as json_file:
-                            # Экранируем название категории
-                            safe_category = escape_markdown(category_name)
-                            
-                            caption = (
-                                f"**📋 Категория:** {safe_category}\n\n"
-                                f"**🎯 Пушей в категории:** {len(category_data['pushes'])}\n"
-                                f"**🌍 Языков:** {len(category_data['languages'])}\n\n"
-                                "*Файл готов к использованию\\!* ✨"
-                            )
-                            
-                            await update.message.reply_document(
-                                document=json_file,
-                                filename=json_filename,
-                                caption=caption,
-                                parse_mode='Markdown'
-                            )
-                    
-                    # Удаляем временные файлы
-                    for json_file_path in json_files_paths:
-                        os.unlink(json_file_path)
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка при конвертации файла: {e}")
-                    await processing_msg.edit_text(
-                        "**❌ Ошибка при обработке файла**\n\n"
-                        f"*Произошла ошибка:* `{str(e)}`\n\n"
-                        "*Убедись, что файл имеет правильную структуру*\n"
-                        "*Используй /help для получения помощи* 💡",
-                        parse_mode='Markdown'
+                    self.converter.cache_categories(content_hash, categories_data)
+
+                # Создаем JSON для каждой категории прямо в памяти
+                base_filename = document.file_name.split('.')[0]
+
+                def build_category_json(item):
+                    category, category_data = item
+
+                    # Создаем имя файла для категории
+                    safe_category = category.lower().replace(' ', '_').replace('&', 'and')
+                    json_filename = f"{safe_category}_{base_filename}.json"
+
+                    # orjson сразу отдает UTF-8 байты - диск не нужен
+                    return json_filename, orjson.dumps(category_data, option=orjson.OPT_INDENT_2)
+
+                # Сериализуем категории параллельно - задачи независимы,
+                # а orjson отпускает GIL; run_in_executor не блокирует event loop
+                json_payloads = await asyncio.gather(*(
+                    loop.run_in_executor(None, build_category_json, item)
+                    for item in categories_data.items()
+                ))
+
+                # Отправляем информационное сообщение
+                first_category = next(iter(categories_data.values()))
+                languages = first_category['languages']
+                total_languages = len(languages)
+                total_categories = len(categories_data)
+
+                # Экранируем специальные символы для Markdown
+                safe_filename = escape_markdown(document.file_name)
+
+                info_message = (
+                    "*✅ Конвертация завершена\\!*\n\n"
+                    f"*📁 Исходный файл:* {safe_filename}\n"
+                    f"*📊 Найдено языков:* {total_languages}\n"
+                    f"*📋 Найдено категорий:* {total_categories}\n\n"
+                    f"*🌍 Языки:* {', '.join(escape_markdown(lang) for lang in languages)}\n\n"
+                    f"*📦 Создано файлов:* {len(json_payloads)}\n"
+                    "_Отправляю отдельные JSON файлы для каждой категории\\.\\.\\. 🚀_"
+                )
+
+                await processing_msg.edit_text(info_message, parse_mode=ParseMode.MARKDOWN_V2)
+
+                async def send_batch(batch):
+                    """Отправляет пачку файлов категорий одним запросом."""
+                    # sendMediaGroup принимает от 2 до 10 документов -
+                    # одиночный файл отправляем обычным документом
+                    if len(batch) == 1:
+                        json_filename, payload, caption = batch[0]
+                        await update.message.reply_document(
+                            document=BytesIO(payload),
+                            filename=json_filename,
+                            caption=caption,
+                            parse_mode=ParseMode.MARKDOWN_V2
+                        )
+                        return
+
+                    await update.message.reply_media_group(media=[
+                        InputMediaDocument(
+                            media=BytesIO(payload),
+                            filename=json_filename,
+                            caption=caption,
+                            parse_mode=ParseMode.MARKDOWN_V2
+                        )
+                        for json_filename, payload, caption in batch
+                    ])
+
+                # Отправляем JSON файлы группами до 10 документов за один запрос к API
+                media_batch = []
+
+                for (category_name, category_data), (json_filename, payload) in zip(
+                    categories_data.items(), json_payloads
+                ):
+                    # Экранируем название категории
+                    safe_category = escape_markdown(category_name)
+
+                    caption = (
+                        f"*📋 Категория:* {safe_category}\n\n"
+                        f"*🎯 Пушей в категории:* {len(category_data['pushes'])}\n"
+                        f"*🌍 Языков:* {len(category_data['languages'])}\n\n"
+                        "_Файл готов к использованию\\!_ ✨"
                     )
-                
-                finally:
-                    # Удаляем временный файл
-                    os.unlink(temp_file.name)
+
+                    media_batch.append((json_filename, payload, caption))
+
+                    # Telegram ограничивает медиагруппу 10 документами
+                    if len(media_batch) == 10:
+                        await send_batch(media_batch)
+                        media_batch = []
+
+                if media_batch:
+                    await send_batch(media_batch)
+
+            except Exception as e:
+                logger.error(f"Ошибка при конвертации файла: {e}")
+                await processing_msg.edit_text(
+                    "**❌ Ошибка при обработке файла**\n\n"
+                    f"*Произошла ошибка:* `{str(e)}`\n\n"
+                    "*Убедись, что файл имеет правильную структуру*\n"
+                    "*Используй /help для получения помощи* 💡",
+                    parse_mode='Markdown'
+                )
         
         except Exception as e:
             logger.error(f"Общая ошибка при обработке файла: {e}")
@@ -4,118 +4,154 @@
 Тестовый файл для парсера Excel файлов.
 """
 
-import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Any, Iterator, Tuple
+
+import numpy as np
+import orjson
 import pandas as pd
-from typing import Dict, Any
+
+def _cell(value: Any) -> str:
+    """Приводит значение ячейки к строке; NaN и None превращаются в ""."""
+    # NaN - единственное значение, не равное самому себе: проверка без pd.notna
+    return "" if value is None or value != value else str(value)
+
+def write_category_json(filename: str, category_data: Dict[str, Any], pretty: bool = False) -> None:
+    """
+    Сохраняет данные категории в JSON файл.
+
+    Args:
+        filename: Имя выходного файла
+        category_data: Данные категории
+        pretty: Форматировать с отступами (медленнее и крупнее файл)
+    """
+    option = orjson.OPT_INDENT_2 if pretty else 0
+    with open(filename, 'wb') as f:
+        f.write(orjson.dumps(category_data, option=option))
 
 class PushExcelConverter:
     """Класс для конвертации Excel файлов с пуш-уведомлениями в JSON."""
     
     @staticmethod
-    def parse_excel_to_categories(file_path: str) -> Dict[str, Dict[str, Any]]:
+    def iter_categories(file_path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
         """
-        Конвертирует Excel файл в JSON формат с отдельными файлами для каждой категории.
-        
+        Генератор по категориям Excel файла.
+
+        Отдает пары (категория, данные) по одной, чтобы не держать
+        в памяти результаты всех категорий сразу.
+
         Args:
             file_path: Путь к Excel файлу
-            
-        Returns:
-            Dict с категориями и их данными
+
+        Yields:
+            Пары (название категории, данные категории)
         """
-        try:
-            # Читаем Excel файл
-            df = pd.read_excel(file_path)
-            
-            # Получаем список языков (уникальные значения в первой колонке, исключая NaN)
-            languages = df.iloc[:, 0].dropna().unique().tolist()
-            
-            # Получаем названия категорий (колонки кроме первой)
-            categories = df.columns[1:].tolist()
-            
-            # Результат - словарь с данными для каждой категории
-            categories_data = {}
-            
-            # Создаем данные для каждой категории отдельно
-            for category in categories:
-                # Структура для текущей категории
-                category_result = {
-                    "languages": languages,
-                    "pushes": []
+        # Читаем Excel файл (calamine парсит xlsx в разы быстрее openpyxl)
+        df = pd.read_excel(file_path, engine="calamine")
+        
+        # Получаем список языков (уникальные значения в первой колонке, исключая NaN)
+        languages = df.iloc[:, 0].dropna().unique().tolist()
+        
+        # Получаем названия категорий (колонки кроме первой)
+        categories = df.columns[1:].tolist()
+
+        # Кодируем первую колонку как Categorical: дальше группировка
+        # и проверки работают с int8-кодами вместо сравнения строк
+        # (NaN получает код -1, первый язык - код 0)
+        lang_codes = pd.Categorical(df.iloc[:, 0], categories=languages).codes
+
+        # Группируем строки по пушам один раз - группировка зависит
+        # только от первой колонки и одинакова для всех категорий.
+        # Граница группы - строка с первым языком; np.split режет
+        # массив индексов по этим границам, ведущий хвост без языка
+        # отбрасывается
+        group_starts = np.flatnonzero(lang_codes == 0)
+        push_groups = [
+            group for group in np.split(np.arange(len(df)), group_starts)
+            if len(group) and lang_codes[group[0]] == 0
+        ]
+
+        # Заголовок стоит в строке с языком, сообщение - в следующей
+        # строке без языка; пары считаются сдвигом маски по всему листу
+        is_title = lang_codes >= 0
+        next_is_msg = np.append(~is_title[1:], False) & is_title
+
+        # Колонки категорий отдельными непрерывными массивами (SoA);
+        # после извлечения DataFrame больше не нужен
+        cat_cols = {category: df[category].to_numpy() for category in categories}
+
+        def build_category(category):
+            """Собирает данные для одной категории."""
+            # Структура для текущей категории
+            category_result = {
+                "languages": languages,
+                "pushes": []
+            }
+
+            # Колонка категории - заранее извлеченный непрерывный массив
+            cat_arr = cat_cols[category]
+
+            # Сообщения, выровненные по строкам своих заголовков
+            messages = np.where(next_is_msg, np.append(cat_arr[1:], None), "")
+
+            # Количество групп известно - выделяем список один раз,
+            # без реаллокаций при росте через append
+            pushes = [None] * len(push_groups)
+
+            # Создаем пуши из групп: обходим только строки заголовков
+            push_id = 1
+            for k, group in enumerate(push_groups):
+                # Переводы собираются одной генерацией словаря
+                push_translations = {
+                    languages[lang_codes[row_idx]]: {
+                        "title": _cell(cat_arr[row_idx]),
+                        "message": _cell(messages[row_idx])
+                    }
+                    for row_idx in group
+                    if is_title[row_idx]
                 }
-                
-                # Группируем строки по пушам
-                push_groups = []
-                current_group = []
-                
-                # Проходим по всем строкам и группируем по языкам
-                for i, row in df.iterrows():
-                    lang = row.iloc[0]
-                    
-                    if pd.notna(lang):  # Начало нового языка
-                        if lang == languages[0] and current_group:  # Если это первый язык и уже есть группа
-                            push_groups.append(current_group)
-                            current_group = []
-                        current_group.append(i)
-                    else:  # Строка с сообщением (NaN в первой колонке)
-                        if current_group:
-                            current_group.append(i)
-                
-                # Добавляем последнюю группу
-                if current_group:
-                    push_groups.append(current_group)
-                
-                # Создаем пуши из групп
-                push_id = 1
-                for group in push_groups:
-                    # Проверяем, что в группе есть все языки
-                    push_translations = {}
-                    
-                    i = 0
-                    while i < len(group):
-                        row_idx = group[i]
-                        lang = df.iloc[row_idx, 0]
-                        
-                        if pd.notna(lang) and lang in languages:
-                            title = df.loc[row_idx, category] if category in df.columns else ""
-                            message = ""
-                            
-                            # Проверяем следующую строку для сообщения
-                            if i + 1 < len(group):
-                                next_row_idx = group[i + 1]
-                                if pd.isna(df.iloc[next_row_idx, 0]):
-                                    message = df.iloc[next_row_idx][category] if category in df.columns else ""
-                                    i += 1  # Пропускаем строку с сообщением
-                            
-                            push_translations[lang] = {
-                                "title": str(title) if pd.notna(title) else "",
-                                "message": str(message) if pd.notna(message) else ""
-                            }
-                        
-                        i += 1
-                    
-                    # Фильтруем пустые переводы
-                    filtered_translations = {}
-                    for lang, translation in push_translations.items():
-                        if translation["title"].strip() or translation["message"].strip():
-                            filtered_translations[lang] = translation
-                    
-                    # Добавляем пуш только если есть хотя бы один непустой перевод
-                    if filtered_translations:
-                        push_data = {
-                            "id": f"push_{str(push_id).zfill(3)}",
-                            "translations": filtered_translations
-                        }
-                        category_result["pushes"].append(push_data)
-                        push_id += 1
-                
-                # Сохраняем данные категории
-                categories_data[category] = category_result
-            
-            return categories_data
-            
-        except Exception as e:
-            print(f"Ошибка при парсинге Excel файла: {e}")
-            raise
+
+                # Фильтруем пустые переводы
+                filtered_translations = {}
+                for lang, translation in push_translations.items():
+                    if translation["title"].strip() or translation["message"].strip():
+                        filtered_translations[lang] = translation
+
+                # Добавляем пуш только если есть хотя бы один непустой перевод
+                if filtered_translations:
+                    pushes[k] = {
+                        "id": f"push_{push_id:03d}",
+                        "translations": filtered_translations
+                    }
+                    push_id += 1
+
+            # Группы без непустых переводов отбрасываются
+            category_result["pushes"] = [push for push in pushes if push is not None]
+
+            return category, category_result
+
+        # После общей группировки категории независимы - обрабатываем их
+        # параллельно, но скользящим окном: в работе и в памяти не больше
+        # max_workers категорий одновременно
+        max_workers = os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            remaining = iter(categories)
+            pending = deque(
+                executor.submit(build_category, category)
+                for category in islice(remaining, max_workers)
+            )
+
+            while pending:
+                category, category_result = pending.popleft().result()
+
+                next_category = next(remaining, None)
+                if next_category is not None:
+                    pending.append(executor.submit(build_category, next_category))
+
+                yield category, category_result
 
 def main():
     """Тестирование парсера."""
@@ -125,53 +161,66 @@ def main():
     converter = PushExcelConverter()
     
     try:
-        # Парсим файл (получаем данные для каждой категории отдельно)
-        categories_data = converter.parse_excel_to_categories('push.xlsx')
-        
-        print(f"✅ Парсинг завершен успешно!")
-        print(f"📊 Найдено категорий: {len(categories_data)}")
-        print(f"🌍 Языки: {', '.join(list(categories_data.values())[0]['languages'])}")
-        print()
-        
-        # Сохраняем отдельные JSON файлы для каждой категории
-        for category, category_data in categories_data.items():
+        # Легковесная сводка по категориям вместо хранения всех данных
+        summary = {}
+        languages = []
+        first_category = None
+        example_data = None
+
+        # Парсим файл потоково: каждая категория пишется на диск сразу,
+        # следующие собираются в фоне рабочими потоками генератора
+        for category, category_data in converter.iter_categories('push.xlsx'):
             safe_category = category.lower().replace(' ', '_').replace('&', 'and')
             filename = f"test_{safe_category}.json"
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(category_data, f, ensure_ascii=False, indent=2)
-            
+            write_category_json(filename, category_data)
             print(f"💾 {category}: сохранен в {filename}")
-        
+
+            pushes = category_data['pushes']
+
+            # Пример для английского языка из первого пуша
+            example_en = None
+            if pushes and 'en' in pushes[0]['translations']:
+                en_data = pushes[0]['translations']['en']
+                example_en = (en_data['title'], en_data['message'])
+
+            summary[category] = {
+                "pushes": len(pushes),
+                "languages": len(category_data['languages']),
+                "example_en": example_en
+            }
+
+            # Первая категория дает список языков и пример структуры
+            if first_category is None:
+                first_category = category
+                languages = category_data['languages']
+                example_data = {
+                    "languages": languages,
+                    "pushes": pushes[:1]  # Только первый пуш для краткости
+                }
+
         print()
-        
+        print(f"✅ Парсинг завершен успешно!")
+        print(f"📊 Найдено категорий: {len(summary)}")
+        print(f"🌍 Языки: {', '.join(languages)}")
+
         # Выводим статистику по категориям
-        print("=== СТАТИСТИКА ПО КАТЕГОРИЯМ ===")
-        for i, (category, category_data) in enumerate(categories_data.items()):
+        print("\n=== СТАТИСТИКА ПО КАТЕГОРИЯМ ===")
+        for i, (category, stats) in enumerate(summary.items()):
             print(f"\n{i+1}. **{category}**")
-            print(f"   🎯 Пушей в категории: {len(category_data['pushes'])}")
-            print(f"   🌍 Языков: {len(category_data['languages'])}")
-            
+            print(f"   🎯 Пушей в категории: {stats['pushes']}")
+            print(f"   🌍 Языков: {stats['languages']}")
+
             # Показываем пример для английского языка
-            if category_data['pushes'] and 'en' in category_data['pushes'][0]['translations']:
-                en_data = category_data['pushes'][0]['translations']['en']
-                print(f"   📝 Пример (EN): \"{en_data['title']}\"")
-                print(f"                   \"{en_data['message']}\"")
-        
+            if stats['example_en']:
+                title, message = stats['example_en']
+                print(f"   📝 Пример (EN): \"{title}\"")
+                print(f"                   \"{message}\"")
+
         # Показываем пример структуры для первой категории
         print("\n=== ПРИМЕР СТРУКТУРЫ JSON (первая категория) ===")
-        first_category = list(categories_data.keys())[0]
-        first_category_data = categories_data[first_category]
-        
-        # Показываем только первый пуш для краткости
-        example_data = {
-            "languages": first_category_data["languages"],
-            "pushes": first_category_data["pushes"][:1]  # Только первый пуш
-        }
-        
         print(f"Категория: {first_category}")
-        print(json.dumps(example_data, ensure_ascii=False, indent=2))
-        
+        print(orjson.dumps(example_data, option=orjson.OPT_INDENT_2).decode())
+
     except Exception as e:
         print(f"❌ Ошибка: {e}")
 